@@ -0,0 +1,14 @@
+# Produktivstart: gunicorn main:app
+import os
+
+bind = '0.0.0.0:80'
+
+# Ein Prozess, damit Embedding-Cache und /add_db-Warteschlange geteilt werden;
+# die Threads überlappen die OpenAI/Pinecone-Wartezeiten parallel laufender Requests
+workers = 1
+worker_class = 'gthread'
+# REQUEST_THREADS bestimmt auch die Größe von Pinecones Connection-Pool in main.py
+threads = int(os.environ.get('REQUEST_THREADS', 16))
+
+# Embedding + Pinecone-Abfragen können bei vielen Links länger dauern
+timeout = 120
@@ -1,15 +1,79 @@
-from flask import Flask, request, jsonify
-from openai import OpenAI
+from flask import Flask, Response, request
+from openai import OpenAI, DefaultHttpxClient
+import httpx
+import orjson
 import os
 import re
 import uuid
 import time
+import threading
+import queue
+import itertools
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter, OrderedDict
 from pinecone import Pinecone, ServerlessSpec
 
 app = Flask(__name__)
 
+
+def json_response(data, status=200):
+    """Serialisiert data mit orjson (deutlich schneller als jsonify)."""
+    return Response(orjson.dumps(data), status=status, mimetype='application/json')
+
+
+def streaming_json_array(pages, key=None, extra=None):
+    """
+    Streamt ein JSON-Array seitenweise, ohne die ganze Antwort im Speicher zu halten.
+    Mit key wird das Array als Feld key in ein Objekt eingebettet, das zusätzlich
+    die Felder aus extra enthält.
+    Die erste Seite wird vorab geholt, damit frühe Fehler beim Aufrufer landen
+    und noch als 500 beantwortet werden können; spätere Fehler brechen den Stream ab.
+    """
+    pages = iter(pages)
+    first_page = next(pages, [])
+
+    prefix, suffix = b'[', b']'
+    if key is not None:
+        prefix = b'{' + orjson.dumps(key) + b':['
+        suffix = b']' + b''.join(
+            b',' + orjson.dumps(name) + b':' + orjson.dumps(value)
+            for name, value in (extra or {}).items()
+        ) + b'}'
+
+    def generate():
+        yield prefix
+        first = True
+        try:
+            for page in itertools.chain([first_page], pages):
+                if not page:
+                    continue
+                chunk = b','.join(orjson.dumps(item) for item in page)
+                yield chunk if first else b',' + chunk
+                first = False
+        except Exception as e:
+            # Status ist bereits gesendet; Verbindung abbrechen, damit der Client
+            # eine kaputte Antwort sieht statt eines scheinbar vollständigen Ergebnisses
+            print(f"Error while streaming response, aborting: {e}")
+            raise
+        yield suffix
+    return Response(generate(), mimetype='application/json')
+
+
+# Thread-Pool für parallele Pinecone-Abfragen (reines I/O, daher unkritisch bzgl. GIL)
+QUERY_WORKERS = 16
+# Request-Threads des Servers (gunicorn.conf.py liest denselben Wert)
+REQUEST_THREADS = int(os.environ.get('REQUEST_THREADS', 16))
+
 # OpenAI & Pinecone setup
-openai_client = OpenAI(api_key=os.environ['OPENAI_API_KEY'])
+# Ein gemeinsamer Connection-Pool, damit TCP/TLS-Verbindungen wiederverwendet werden
+openai_client = OpenAI(
+    api_key=os.environ['OPENAI_API_KEY'],
+    http_client=DefaultHttpxClient(
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=100),
+        timeout=httpx.Timeout(30.0, connect=5.0)
+    )
+)
 pinecone_api_key = os.environ['PINECONE_API_KEY']
 index_name = 'custom-gpt'
 
@@ -20,23 +84,105 @@ spec = ServerlessSpec(cloud='aws', region='us-east-1')
 existing = [i["name"] for i in pc.list_indexes()]
 if index_name not in existing:
     pc.create_index(name=index_name, dimension=1536, metric='cosine', spec=spec)
-while not pc.describe_index(index_name).status['ready']:
-    time.sleep(1)
-index = pc.Index(index_name)
+    # Nur ein neuer Index muss erst bereit werden; exponentielles Backoff bis max. 5s
+    delay = 0.1
+    while not pc.describe_index(index_name).status['ready']:
+        time.sleep(delay)
+        delay = min(delay * 2, 5.0)
+# Pool groß genug für alle gleichzeitigen Aufrufer (Thread-Pool, Request-Threads,
+# Indexierungs-Thread), sonst verwirft urllib3 Verbindungen bei parallelen Abfragen
+index = pc.Index(index_name, connection_pool_maxsize=QUERY_WORKERS + REQUEST_THREADS + 1)
+executor = ThreadPoolExecutor(max_workers=QUERY_WORKERS)
 
 
-def get_embedding_vector(text):
-    """Generiert einen Embedding-Vektor für den gegebenen Text."""
+# Maximale Anzahl gecachter Embeddings; als float32-Array ca. 6 KB pro Vektor,
+# voll also rund 50 MB plus die Texte als Schlüssel
+EMBEDDING_CACHE_SIZE = 8192
+# Limit der OpenAI-API für Eingaben pro Embedding-Request
+EMBEDDING_BATCH_SIZE = 2048
+
+_embedding_cache = OrderedDict()
+_embedding_cache_lock = threading.Lock()
+_embedding_cache_stats = {'hits': 0, 'misses': 0}
+
+
+def _cache_get(text):
+    """Liest ein Embedding aus dem LRU-Cache (oder None)."""
+    with _embedding_cache_lock:
+        vector = _embedding_cache.get(text)
+        if vector is None:
+            _embedding_cache_stats['misses'] += 1
+            return None
+        _embedding_cache.move_to_end(text)
+        _embedding_cache_stats['hits'] += 1
+    return vector.tolist()
+
+
+def _cache_put(text, vector):
+    """
+    Legt ein Embedding im LRU-Cache ab und verdrängt das älteste.
+    Gespeichert wird ein kompaktes float32-Array statt einer Liste von Python-Floats (~48 KB).
+    """
+    vector = array('f', vector)
+    with _embedding_cache_lock:
+        _embedding_cache[text] = vector
+        _embedding_cache.move_to_end(text)
+        if len(_embedding_cache) > EMBEDDING_CACHE_SIZE:
+            _embedding_cache.popitem(last=False)
+
+
+def get_embedding_vectors_batch(texts, use_cache=True):
+    """
+    Generiert Embedding-Vektoren für mehrere Texte mit möglichst wenigen Requests.
+    Bereits gecachte Texte werden nicht erneut angefragt. Mit use_cache=False wird
+    der Cache weder gelesen noch befüllt (z.B. für zu indexierende Notes, die nie
+    wieder als Suchtext auftauchen und sonst Anfragen und Link-Namen verdrängen).
+
+    Returns:
+        Liste von Vektoren in der Reihenfolge von texts, oder None bei einem Fehler
+    """
+    keys = [text.strip() for text in texts]
+    vectors = {}
+    missing = []
+    for key in dict.fromkeys(keys):
+        vector = _cache_get(key) if use_cache else None
+        if vector is None:
+            missing.append(key)
+        else:
+            vectors[key] = vector
+
     try:
-        response = openai_client.embeddings.create(
-            input=[text],
-            model="text-embedding-3-small"
-        )
-        return response.data[0].embedding
+        for start in range(0, len(missing), EMBEDDING_BATCH_SIZE):
+            chunk = missing[start:start + EMBEDDING_BATCH_SIZE]
+            response = openai_client.embeddings.create(
+                input=chunk,
+                model="text-embedding-3-small"
+            )
+            for key, item in zip(chunk, response.data):
+                vectors[key] = item.embedding
+                if use_cache:
+                    _cache_put(key, item.embedding)
     except Exception as e:
         print(f"Error generating embeddings: {e}")
         return None
 
+    return [vectors[key] for key in keys]
+
+
+def get_embedding_vector(text, use_cache=True):
+    """Generiert einen Embedding-Vektor für den gegebenen Text."""
+    vectors = get_embedding_vectors_batch([text], use_cache=use_cache)
+    return vectors[0] if vectors else None
+
+
+def _to_match(match):
+    """Wandelt einen Pinecone-Treffer in ein Ergebnis-Dict um."""
+    return {
+        'id': match['id'],
+        'score': match['score'],
+        'text': match.get('metadata', {}).get('text', '')
+    }
+
 
 def query_similar_texts(embedding_vector, top_k):
     """Sucht ähnliche Texte in Pinecone."""
@@ -45,51 +191,122 @@ def query_similar_texts(embedding_vector, top_k):
         top_k=top_k,
         include_metadata=True
     )
-    return [
-        {
-            'id': match['id'],
-            'score': match['score'],
-            'text': match.get('metadata', {}).get('text', '')
-        }
-        for match in results['matches']
-    ]
+    return [_to_match(match) for match in results['matches']]
+
+
+# Hinweis an das GPT, wie die linked_results zu lesen sind
+LINKED_RESULTS_HINT = 'Die linked_results stammen aus Notes, die in den primary_results verlinkt wurden. Prüfe ob diese zusätzlichen Infos für die Anfrage relevant sind.'
+
+# Maximale Anzahl verfolgter Links pro Anfrage (schützt vor Seiten mit hunderten Links)
+MAX_LINK_EXPANSION = 20
+
+# Pattern für [[Note Name]] oder [[Note Name|Alias]]
+_WIKI_LINK_RE = re.compile(r'\[\[([^\]|]+)(?:\|[^\]]+)?\]\]')
 
 
 def extract_obsidian_links(text):
     """
     Extrahiert alle [[wiki-links]] aus einem Text.
-    Gibt eine Liste von Note-Namen zurück.
+    Gibt einen Generator von Note-Namen zurück (Duplikate entfernt der Aufrufer).
+    """
+    return (link.strip() for link in _WIKI_LINK_RE.findall(text))
+
+
+def iter_all_entries():
+    """
+    Liest alle Einträge seitenweise per list()/fetch() aus, ganz ohne Vektorsuche.
+    Liefert pro Seite eine Liste von Dicts (id, text).
+    """
+    for ids in index.list():
+        ids = list(ids)
+        fetched = index.fetch(ids=ids)
+        page = []
+        for vector_id in ids:
+            vector = fetched.vectors.get(vector_id)
+            if vector is None:
+                continue
+            page.append({'id': vector_id, 'text': (vector.metadata or {}).get('text', '')})
+        yield page
+
+
+def query_notes_by_title(embedding_vector, titles, top_k_per_title=3):
+    """
+    Sucht Notes über das title-Metadatum mit einer einzigen Pinecone-Abfrage.
+    
+    Returns:
+        Dict Titel -> höchstens top_k_per_title Ergebnisse (leer, wenn keine Note den Titel trägt)
     """
-    # Pattern für [[Note Name]] oder [[Note Name|Alias]]
-    pattern = r'\[\[([^\]|]+)(?:\|[^\]]+)?\]\]'
-    links = re.findall(pattern, text)
-    # Duplikate entfernen und bereinigen
-    return list(set([link.strip() for link in links]))
+    results = index.query(
+        vector=embedding_vector,
+        top_k=top_k_per_title * len(titles),
+        include_metadata=True,
+        filter={'title': {'$in': titles}}
+    )
+    matches_by_title = {title: [] for title in titles}
+    for match in results['matches']:
+        title = match.get('metadata', {}).get('title', '')
+        # Eine Note mit vielen Vektoren darf nicht alle Plätze der anderen Titel belegen
+        if title in matches_by_title and len(matches_by_title[title]) < top_k_per_title:
+            matches_by_title[title].append(_to_match(match))
+    return matches_by_title
 
 
-def search_linked_notes(linked_note_names, original_query, already_found_ids):
+def search_linked_notes(linked_note_names, original_query, already_found_ids,
+                        query_embedding=None, title_matches=None):
     """
     Sucht nach den verlinkten Notes in Pinecone.
     
+    Notes mit title-Metadatum werden direkt per Filter gefunden; nur für die
+    übrigen Namen (z.B. ältere Einträge ohne Titel) wird eingebettet und einzeln gesucht.
+    
     Args:
         linked_note_names: Liste der Note-Namen aus [[Links]]
         original_query: Die ursprüngliche Suchanfrage (für Relevanz-Scoring)
         already_found_ids: IDs der bereits gefundenen Ergebnisse (um Duplikate zu vermeiden)
+        query_embedding: Embedding der Suchanfrage, sortiert die Treffer des Titel-Filters
+        title_matches: Bereits per Titel-Filter abgefragte Namen (Ergebnis von query_notes_by_title)
     
     Returns:
         Liste von Ergebnissen mit Zusatz-Info woher der Link kam
     """
     linked_results = []
+    title_matches = dict(title_matches or {})
     
+    if query_embedding is not None:
+        unqueried_names = [name for name in linked_note_names if name not in title_matches]
+        if unqueried_names:
+            title_matches.update(query_notes_by_title(query_embedding, unqueried_names))
+    
+    remaining_names = []
     for note_name in linked_note_names:
-        # Suche nach dem Note-Namen
-        embedding = get_embedding_vector(note_name)
-        if embedding is None:
+        matches = title_matches.get(note_name)
+        if not matches:
+            remaining_names.append(note_name)
             continue
-        
-        # Weniger Ergebnisse pro verlinkter Note
-        matches = query_similar_texts(embedding, top_k=3)
-        
+        for match in matches:
+            if match['id'] in already_found_ids:
+                continue
+            match['source'] = 'linked'
+            match['linked_from'] = note_name
+            linked_results.append(match)
+            already_found_ids.add(match['id'])
+    
+    if not remaining_names:
+        return linked_results
+    
+    # Alle Note-Namen in einem einzigen Request einbetten
+    embeddings = get_embedding_vectors_batch(remaining_names)
+    if embeddings is None:
+        return linked_results
+    
+    # Weniger Ergebnisse pro verlinkter Note; Abfragen laufen parallel,
+    # map() liefert sie aber in Eingabe-Reihenfolge (deterministische Duplikat-Auflösung)
+    all_matches = executor.map(
+        lambda embedding: query_similar_texts(embedding, top_k=3),
+        embeddings
+    )
+    
+    for note_name, matches in zip(remaining_names, all_matches):
         for match in matches:
             # Duplikate überspringen
             if match['id'] in already_found_ids:
@@ -116,38 +333,68 @@ def retrieve_db():
     Erweitertes Retrieval mit Graph-Awareness.
     
     Parameter:
-        - text: Suchbegriff (required)
+        - text: Suchbegriff (required, außer bei top_k=all)
         - top_k: Anzahl der Ergebnisse (optional, default: 10)
+          "all" liefert alle Einträge ungerankt und ohne score; mit follow_links=true
+          im gewohnten Objekt mit leeren linked_results/extracted_links und hint
         - follow_links: "true"/"false" - Soll den [[Links]] gefolgt werden? (optional, default: true)
         - link_depth: Wie viele Link-Ebenen verfolgen? (optional, default: 1)
     """
-    text = request.args.get('text')
-    if not text:
-        return jsonify({"error": "No text provided"}), 400
-
     # Parameter auslesen
+    text = request.args.get('text')
     top_k_param = request.args.get('top_k', None)
     follow_links = request.args.get('follow_links', 'true').lower() == 'true'
     
+    # Alle Einträge: keine Ähnlichkeitssuche nötig, Links sind ohnehin enthalten
+    if top_k_param and top_k_param.lower() == 'all':
+        pages = (
+            [dict(entry, source='primary') for entry in page]
+            for page in iter_all_entries()
+        )
+        try:
+            if not follow_links:
+                return streaming_json_array(pages)
+            return streaming_json_array(
+                pages,
+                key='primary_results',
+                extra={'linked_results': [], 'extracted_links': [], 'hint': LINKED_RESULTS_HINT}
+            )
+        except Exception as e:
+            print(f"Error listing Pinecone entries: {e}")
+            return json_response({"error": "Failed to list entries from Pinecone database"}, 500)
+
+    if not text:
+        return json_response({"error": "No text provided"}, 400)
+    
     # top_k bestimmen
     if top_k_param:
-        if top_k_param.lower() == 'all':
-            stats = index.describe_index_stats()
-            top_k = stats.get('total_vector_count', 10)
-        else:
-            try:
-                top_k = int(top_k_param)
-            except ValueError:
-                return jsonify({"error": "Invalid top_k parameter"}), 400
+        try:
+            top_k = int(top_k_param)
+        except ValueError:
+            return json_response({"error": "Invalid top_k parameter"}, 400)
     else:
         top_k = 10
 
     # Phase 1: Normale Suche
     embedding_vector = get_embedding_vector(text)
     if embedding_vector is None:
-        return jsonify({"error": "Failed to generate embeddings"}), 500
+        return json_response({"error": "Failed to generate embeddings"}, 500)
 
-    primary_results = query_similar_texts(embedding_vector, top_k)
+    query_links = []
+    if follow_links:
+        query_links = list(dict.fromkeys(link for link in extract_obsidian_links(text) if link))
+        query_links = query_links[:MAX_LINK_EXPANSION]
+    
+    query_title_matches = {}
+    if query_links:
+        # Primärabfrage im Thread-Pool, währenddessen die [[Links]] der Suchanfrage
+        # selbst per Titel-Filter auflösen
+        future_primary = executor.submit(query_similar_texts, embedding_vector, top_k)
+        query_title_matches = query_notes_by_title(embedding_vector, query_links)
+        primary_results = future_primary.result()
+    else:
+        # Nichts zu überlappen: direkt abfragen, statt einen Platz im geteilten Pool zu belegen
+        primary_results = query_similar_texts(embedding_vector, top_k)
     
     # Markiere primäre Ergebnisse
     for result in primary_results:
@@ -155,52 +402,70 @@ def retrieve_db():
     
     # Wenn follow_links deaktiviert ist, nur primäre Ergebnisse zurückgeben
     if not follow_links:
-        return jsonify(primary_results)
+        return json_response(primary_results)
     
     # Phase 2: Links aus den gefundenen Notes extrahieren
-    all_links = set()
-    already_found_ids = set([r['id'] for r in primary_results])
-    
+    link_counts = Counter()
     for result in primary_results:
-        links = extract_obsidian_links(result.get('text', ''))
-        all_links.update(links)
+        link_counts.update(
+            link for link in extract_obsidian_links(result['text']) if link
+        )
+    
+    if not link_counts and not query_links:
+        return json_response({
+            'primary_results': primary_results,
+            'linked_results': [],
+            'extracted_links': []
+        })
+    
+    # Links aus der Suchanfrage zuerst, danach die am häufigsten verlinkten Notes,
+    # maximal MAX_LINK_EXPANSION
+    all_links = query_links + [
+        link for link, _ in link_counts.most_common() if link not in query_links
+    ]
+    all_links = all_links[:MAX_LINK_EXPANSION]
+    already_found_ids = {r['id'] for r in primary_results}
     
     # Phase 3: Verlinkte Notes suchen
-    linked_results = []
-    if all_links:
-        linked_results = search_linked_notes(
-            list(all_links), 
-            text, 
-            already_found_ids
-        )
+    linked_results = search_linked_notes(
+        all_links, 
+        text, 
+        already_found_ids,
+        query_embedding=embedding_vector,
+        title_matches=query_title_matches
+    )
     
     # Ergebnis strukturieren
     response = {
         'primary_results': primary_results,
         'linked_results': linked_results,
-        'extracted_links': list(all_links),
-        'hint': 'Die linked_results stammen aus Notes, die in den primary_results verlinkt wurden. Prüfe ob diese zusätzlichen Infos für die Anfrage relevant sind.'
+        'extracted_links': all_links,
+        'hint': LINKED_RESULTS_HINT
     }
     
-    return jsonify(response)
+    return json_response(response)
 
 
 @app.route('/add_db', methods=['POST'])
 def add_db():
-    """Fügt einen Text zur Datenbank hinzu."""
+    """
+    Fügt einen Text zur Datenbank hinzu.
+    Embedding und Upsert laufen im Hintergrund, daher antwortet der Endpoint mit 202.
+    """
     data = request.json
-    if not data or 'text' not in data:
-        return jsonify({"error": "No text provided"}), 400
-    text = data['text']
-
-    embedding_vector = get_embedding_vector(text)
-    if embedding_vector is None:
-        return jsonify({"error": "Failed to generate embeddings"}), 500
+    text = data.get('text') if isinstance(data, dict) else None
+    # Nur echte, nicht-leere Strings annehmen; alles andere würde erst im Worker scheitern
+    if not isinstance(text, str) or not text.strip():
+        return json_response({"error": "No text provided"}, 400)
+    # Zu lange Texte würden erst im Hintergrund am Embedding- bzw. Metadaten-Limit scheitern
+    if len(text.encode('utf-8')) > MAX_TEXT_BYTES:
+        return json_response({"error": f"Text too large (max. {MAX_TEXT_BYTES} bytes)"}, 413)
 
-    if not save_to_pinecone(text, embedding_vector):
-        return jsonify({"error": "Failed to save to Pinecone database"}), 500
-
-    return jsonify({"message": "Text added successfully"}), 200
+    try:
+        _add_queue.put_nowait(text)
+    except queue.Full:
+        return json_response({"error": "Indexing queue is full, please retry later"}, 503)
+    return json_response({"message": "Text queued for indexing"}, 202)
 
 
 @app.route('/delete_db', methods=['POST'])
@@ -208,30 +473,182 @@ def delete_db():
     """Löscht einen Eintrag aus der Datenbank."""
     data = request.json
     if not data or 'id' not in data:
-        return jsonify({"error": "No vector ID provided"}), 400
+        return json_response({"error": "No vector ID provided"}, 400)
     vector_id = data['id']
 
     try:
         delete_response = index.delete(ids=[vector_id])
-        return jsonify({
+        return json_response({
             "message": "Vector deleted successfully",
             "details": delete_response
-        }), 200
+        }, 200)
     except Exception as e:
         print(f"Error deleting from Pinecone: {e}")
-        return jsonify({"error": "Failed to delete from Pinecone database"}), 500
+        return json_response({"error": "Failed to delete from Pinecone database"}, 500)
+
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    """Gibt Trefferstatistiken des Embedding-Caches zurück."""
+    with _embedding_cache_lock:
+        return json_response({
+            "hits": _embedding_cache_stats['hits'],
+            "misses": _embedding_cache_stats['misses'],
+            "size": len(_embedding_cache),
+            "maxsize": EMBEDDING_CACHE_SIZE
+        })
+
+
+# Maximale Titellänge; hält einzeilige Notes unter Pinecones 40 KB Metadaten-Limit
+MAX_TITLE_LENGTH = 200
+
+
+def extract_note_title(text):
+    """
+    Bestimmt den Titel einer Note, über den [[Links]] sie finden.
+    Nutzt "title:" aus dem Front-Matter, sonst die erste nicht-leere Zeile ohne "#",
+    gekürzt auf MAX_TITLE_LENGTH Zeichen.
+    """
+    lines = text.strip().splitlines()
+    if lines and lines[0].strip() == '---':
+        for i, line in enumerate(lines[1:], start=1):
+            if line.strip() == '---':
+                lines = lines[i + 1:]
+                break
+            key, _, value = line.partition(':')
+            if key.strip().lower() == 'title' and value.strip():
+                return value.strip().strip('"\'')[:MAX_TITLE_LENGTH]
+        else:
+            # Front-Matter nie geschlossen: nur die einleitende "---"-Zeile überspringen
+            lines = lines[1:]
+    for line in lines:
+        title = line.strip().lstrip('#').strip()
+        if title:
+            return title[:MAX_TITLE_LENGTH]
+    return ''
+
 
+# Maximale Größe eines Upsert-Requests; Pinecone erlaubt 2 MB, ein Vektor allein
+# ist als JSON schon ca. 32 KB groß
+UPSERT_MAX_BYTES = 1500000
 
-def save_to_pinecone(text, embedding_vector):
-    """Speichert einen Text mit seinem Embedding in Pinecone."""
+
+def _split_by_size(texts, vectors):
+    """Teilt (Text, Vektor)-Paare in Gruppen, deren JSON unter UPSERT_MAX_BYTES bleibt."""
+    group, group_bytes = [], 0
+    for text, vector in zip(texts, vectors):
+        size = len(orjson.dumps(vector))
+        if group and group_bytes + size > UPSERT_MAX_BYTES:
+            yield group
+            group, group_bytes = [], 0
+        group.append((text, vector))
+        group_bytes += size
+    if group:
+        yield group
+
+
+def _upsert_group(group):
+    """
+    Speichert eine Gruppe in einem Upsert; schlägt er fehl, wird jeder Text einzeln wiederholt.
+    
+    Returns:
+        Liste der Texte, die nicht gespeichert werden konnten
+    """
     try:
-        unique_id = str(uuid.uuid4())
-        index.upsert(vectors=[(unique_id, embedding_vector, {"text": text})])
-        return True
+        index.upsert(vectors=[vector for _, vector in group])
+        return []
     except Exception as e:
         print(f"Error saving to Pinecone: {e}")
-        return False
+    if len(group) == 1:
+        return [group[0][0]]
+
+    # Einzeln wiederholen, damit ein fehlerhafter Text nicht die ganze Gruppe verwirft
+    failed = []
+    for text, vector in group:
+        try:
+            index.upsert(vectors=[vector])
+        except Exception as e:
+            print(f"Error saving to Pinecone: {e}")
+            failed.append(text)
+    return failed
+
+
+def save_to_pinecone(texts, embedding_vectors):
+    """
+    Speichert Texte mit ihren Embeddings in möglichst wenigen Upserts in Pinecone,
+    aufgeteilt nach Request-Größe.
+    
+    Returns:
+        Liste der Texte, die nicht gespeichert werden konnten
+    """
+    vectors = [
+        (str(uuid.uuid4()), embedding_vector, {"text": text, "title": extract_note_title(text)})
+        for text, embedding_vector in zip(texts, embedding_vectors)
+    ]
+    failed = []
+    for group in _split_by_size(texts, vectors):
+        failed.extend(_upsert_group(group))
+    return failed
+
+
+# Maximale Anzahl Texte pro Batch; die Upserts teilt save_to_pinecone zusätzlich nach Größe
+UPSERT_BATCH_SIZE = 100
+# Wie lange nach dem ersten Text auf weitere gewartet wird (Sekunden)
+UPSERT_BATCH_WINDOW = 0.05
+
+# Maximale Länge eines Textes in Bytes (UTF-8); bleibt unter dem Embedding-Limit
+# von 8191 Tokens und unter Pinecones 40 KB Metadaten pro Eintrag
+MAX_TEXT_BYTES = 24000
+# Maximale Anzahl wartender Texte; darüber antwortet /add_db mit 503
+ADD_QUEUE_SIZE = 1000
+
+_add_queue = queue.Queue(maxsize=ADD_QUEUE_SIZE)
+
+
+def _index_batch(texts):
+    """Erzeugt die Embeddings für einen Batch und speichert ihn in Pinecone."""
+    embedding_vectors = get_embedding_vectors_batch(texts, use_cache=False)
+    if embedding_vectors is None:
+        # Einzeln wiederholen, damit ein fehlerhafter Text nicht den ganzen Batch verwirft
+        pairs = [(text, get_embedding_vector(text, use_cache=False)) for text in texts]
+        dropped = sum(1 for _, vector in pairs if vector is None)
+        if dropped:
+            print(f"Dropped {dropped} texts: embedding failed")
+        pairs = [(text, vector) for text, vector in pairs if vector is not None]
+        texts = [text for text, _ in pairs]
+        embedding_vectors = [vector for _, vector in pairs]
+
+    if texts:
+        failed = save_to_pinecone(texts, embedding_vectors)
+        if failed:
+            print(f"Dropped {len(failed)} texts: upsert failed")
+
+
+def _index_worker():
+    """Arbeitet die Warteschlange von /add_db ab und speichert in Batches."""
+    while True:
+        texts = [_add_queue.get()]
+        # Kurz sammeln, damit gleichzeitige Requests im selben Upsert landen
+        deadline = time.monotonic() + UPSERT_BATCH_WINDOW
+        while len(texts) < UPSERT_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                texts.append(_add_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        # Ein fehlerhafter Batch darf den einzigen Indexierungs-Thread nicht beenden
+        try:
+            _index_batch(texts)
+        except Exception as e:
+            print(f"Error indexing batch of {len(texts)} texts: {e}")
+
+
+threading.Thread(target=_index_worker, daemon=True).start()
 
 
 if __name__ == '__main__':
-    app.run(debug=True, port=80, host='0.0.0.0')
+    # Nur für die lokale Entwicklung; produktiv über gunicorn starten (siehe gunicorn.conf.py)
+    app.run(debug=os.environ.get('FLASK_DEBUG') == '1', port=80, host='0.0.0.0')